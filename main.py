@@ -1,22 +1,18 @@
 import os
 import re
+import time
 import json
-import uuid
+import base64
+import pickle
 import asyncio
-import platform
-import subprocess
-import html
-from io import BytesIO
+import hashlib
+import functools
+import unicodedata
 from pathlib import Path
+from collections import OrderedDict
 
-from PIL import Image, ImageDraw, ImageFont, ImageColor
-from pygments import highlight
-from pygments.lexers import get_lexer_by_name, guess_lexer, get_lexer_for_filename
-from pygments.formatters import ImageFormatter, HtmlFormatter
-from pygments.styles import get_style_by_name
-from pygments.util import ClassNotFound
-from pygments.lexer import RegexLexer, bygroups, include, words
-from pygments.token import Text, Comment, Operator, Keyword, Name, String, Number, Punctuation, Token
+# Pygments 与 PIL 只在 Pygments 回退渲染 / 字体探测里用到，按需延迟导入，
+# 省下插件加载时数百毫秒的导入开销
 
 from astrbot.api.event import filter, AstrMessageEvent, MessageEventResult
 from astrbot.api.message_components import Image as ImageComponent, Plain, Reply, File
@@ -27,6 +23,140 @@ from astrbot.core.utils.astrbot_path import get_astrbot_data_path
 from playwright.async_api import async_playwright
 
 
+# 消息中的 markdown 代码块 / 单行代码匹配，模块加载时编译一次；
+# 合并为单个交替式，一趟扫描同时覆盖两种写法（代码块优先）
+CODE_RE = re.compile(
+    r'(?:```(?P<lang>\w*)\n?(?P<block>[\s\S]*?)```)|(?:`(?P<inline>[^`]+)`)'
+)
+
+@functools.lru_cache(maxsize=128)
+def _cached_lexer(name: str):
+    """按名称缓存 Pygments lexer 实例，免去每次的 entry-point 遍历"""
+    from pygments.lexers import get_lexer_by_name
+    return get_lexer_by_name(name, stripall=True)
+
+
+@functools.lru_cache(maxsize=32)
+def _cached_style(name: str):
+    """按名称缓存 Pygments style 解析结果"""
+    from pygments.styles import get_style_by_name
+    return get_style_by_name(name)
+
+
+def _resolve_pygments_style(theme_name: str):
+    """解析 Pygments style，hljs 专有主题名解析失败时回退到 monokai"""
+    from pygments.util import ClassNotFound
+    try:
+        return _cached_style(theme_name)
+    except ClassNotFound:
+        return _cached_style("monokai")
+
+
+# 快速语言特征签名：在昂贵的 guess_lexer 之前先按标志性语法粗筛
+QUICK_LANG_SIGS = [
+    (re.compile(r'^\s*def\s+\w+\s*\(', re.M), 'python'),
+    (re.compile(r'#include\s*[<"]'), 'cpp'),
+    (re.compile(r'<\?php'), 'php'),
+    (re.compile(r'^\s*(?:function\s+\w+\s*\(|const\s+\w+\s*=|let\s+\w+\s*=)', re.M), 'javascript'),
+    (re.compile(r'^\s*(?:public|private)\s+(?:static\s+)?class\s', re.M), 'java'),
+    (re.compile(r'^\s*fn\s+\w+\s*\(', re.M), 'rust'),
+    (re.compile(r'^\s*package\s+main\b', re.M), 'go'),
+    (re.compile(r'^#!\s*/(?:usr/)?bin/(?:env\s+)?(?:ba)?sh', re.M), 'bash'),
+]
+
+def _max_line_em_width(code: str) -> float:
+    """估算最长行的显示宽度（em）
+
+    等宽拉丁字形约 0.6em，东亚全宽/宽字形（中文等）约 1.0em；
+    按实际宽度估算才能决定是否可以安全关闭自动换行。
+    """
+    widest = 0.0
+    for line in code.splitlines():
+        wide = sum(1 for c in line if unicodedata.east_asian_width(c) in "WF")
+        width = wide + (len(line) - wide) * 0.6
+        if width > widest:
+            widest = width
+    return widest
+
+
+@functools.lru_cache(maxsize=512)
+def _sig_scan(code_head: str) -> str | None:
+    """对代码开头做特征签名粗筛，结果按内容缓存
+
+    聊天场景下同一段代码常被反复渲染，缓存命中时直接跳过全部正则扫描。
+    只取前 4KB 作键，既够签名判定也避免对超长代码做哈希。
+    """
+    for sig, sig_lang in QUICK_LANG_SIGS:
+        if sig.search(code_head):
+            return sig_lang
+    return None
+
+
+# _parse_render_args 的参数分发表：整 token / key= 前缀 / 行号开关各一张，
+# 每个 token 只做一次哈希命中而非逐条 if/elif 比较
+_ARG_VALUE_FLAGS = {"-l": "language", "-t": "theme", "-s": "font_size"}
+_ARG_PREFIXES = {"lang=": "language", "theme=": "theme", "size=": "font_size"}
+_ARG_TOGGLES = {
+    "noline": False, "-n": False, "--no-line": False,
+    "line": True, "-ln": True, "--line": True,
+}
+
+# languages.pkl 缓存格式版本，载荷结构变更时递增使旧缓存失效
+_LANG_CACHE_VERSION = 2
+
+# 纯静态页面截图用不到的 Chromium 子系统一律关掉，降低启动耗时与常驻内存
+CHROMIUM_LAUNCH_ARGS = [
+    "--disable-gpu",
+    "--disable-dev-shm-usage",
+    "--disable-extensions",
+    "--no-first-run",
+    "--disable-background-networking",
+    "--disable-sync",
+    "--disable-features=TranslateUI,BackForwardCache,MediaRouter",
+    "--hide-scrollbars",
+    "--mute-audio",
+]
+
+# 常驻渲染页中的重渲染入口：每次渲染只换主题 CSS、代码与高亮结果，
+# 不重新发送/解析整份文档（hljs 源码只被 V8 解析一次）
+RENDER_FN_JS = """
+    window.__render = function (opts) {
+        document.getElementById('theme-css').textContent = opts.themeCss;
+        if (opts.customLangJs) {
+            try { (0, eval)(opts.customLangJs); } catch (e) { console.error('custom language error', e); }
+        }
+        var pre = document.querySelector('pre');
+        pre.style.fontSize = opts.fontSize + 'px';
+        pre.style.whiteSpace = opts.wrap ? 'pre-wrap' : 'pre';
+        // 重建 code 元素，清掉上一次的高亮/行号 DOM
+        pre.innerHTML = '<code id="code" class="hljs"></code>';
+        var block = document.getElementById('code');
+        block.textContent = opts.code;
+        try {
+            if (!window.hljs) { console.error('highlight.js not loaded'); return false; }
+            if (opts.language) {
+                block.className = 'hljs language-' + opts.language;
+                window.hljs.highlightElement(block);
+            } else {
+                var result = window.hljs.highlightAuto(opts.code);
+                block.innerHTML = result.value;
+                block.className = 'hljs ' + (result.language || '');
+            }
+            if (opts.lineNumbers && typeof window.hljs.lineNumbersBlock === 'function') {
+                window.hljs.lineNumbersBlock(block, {
+                    startFrom: opts.lnStart,
+                    singleLine: opts.lnSingle,
+                    lineNumberWidth: opts.lnWidth
+                });
+            }
+        } catch (e) {
+            console.error('highlight.js error', e);
+        }
+        return true;
+    };
+"""
+
+
 @register("astrbot_plugin_code_renderer", "Xbodw", "将代码信息或者代码文件渲染为图片", "1.5.0")
 class CodeRenderPlugin(Star):
     def __init__(self, context: Context, config: AstrBotConfig | None = None):
@@ -34,9 +164,42 @@ class CodeRenderPlugin(Star):
         self.config = config
         self.custom_languages = {}  # Store custom language definitions for highlight.js registration
         self.temp_dir = os.path.join(get_astrbot_data_path(), "temp", "code_render")
-        self._cached_font = None  # Cached available font
         self._playwright = None   # Global Playwright instance
         self._browser = None      # Shared browser instance
+        self._browser_verified = False  # One-shot flag: Chromium install already verified
+        self._shared_context = None       # Single BrowserContext shared by all render tabs
+        self._context_pool: asyncio.Queue | None = None  # Pool of pre-warmed render tabs
+        self._context_pool_size = 0
+        self._hljs_inline_cache = None      # Pre-built inline JS (hljs + line-number plugin)
+        self._custom_lang_script_cache = {}  # language id -> hljs registration script
+        self._theme_css_cache = {}          # theme name -> CSS text
+        self._html_shell_cache = None       # Static HTML shell loaded once into each pool slot
+        self._font_face_css = None          # Resolved @font-face CSS block (computed once)
+        self._font_family = None            # Resolved CSS font-family (computed once)
+        self._render_cache = OrderedDict()  # content key -> PNG bytes (LRU)
+        self._render_cache_max = 64
+        self._inflight = {}                 # content key -> in-flight render task (single-flight)
+        self._cleanup_task = None           # Periodic temp-cleanup task handle
+        self._stop_event = asyncio.Event()  # Signals the cleanup task to exit
+        # Hoisted config values used on every request
+        self._default_theme_display = (
+            config.get("theme", "monokai") if config else "monokai"
+        )
+        self._cfg_default_theme = config.get("default_theme", "github-dark") if config else "github-dark"
+        self._cfg_font_size = config.get("font_size", 14) if config else 14
+        self._cfg_ln_enabled = config.get("line_numbers_enabled", True) if config else True
+        self._cfg_ln_start = (
+            config.get("line_numbers_start_from", 1)
+            if (config and isinstance(config.get("line_numbers_start_from", 1), int))
+            else 1
+        )
+        self._cfg_ln_single = bool(config.get("line_numbers_single_line", False)) if config else False
+        _w = config.get("line_numbers_width", None) if config else None
+        self._cfg_ln_width = _w if (isinstance(_w, int) and _w > 0) else None
+        _fmt = config.get("image_format", "png") if config else "png"
+        self._cfg_image_format = _fmt if _fmt in ("png", "webp", "jpeg") else "png"
+        self._ext_to_lang = {}              # file extension -> language id (standard + custom)
+        self._alias_to_lang = {}            # custom language alias -> language id
 
         self.standard_language_map = {
             # Common programming languages
@@ -106,7 +269,7 @@ class CodeRenderPlugin(Star):
     async def initialize(self):
         """Initialize the plugin"""
         self._load_custom_languages()
-        
+
         # Create temp directory
         os.makedirs(self.temp_dir, exist_ok=True)
 
@@ -118,99 +281,151 @@ class CodeRenderPlugin(Star):
             if self._playwright is None:
                 self._playwright = await async_playwright().start()
             if self._browser is None:
-                self._browser = await self._playwright.chromium.launch(headless=True)
+                self._browser = await self._playwright.chromium.launch(headless=True, args=CHROMIUM_LAUNCH_ARGS)
                 logger.info("CodeRender Playwright 浏览器已启动")
+            await self._init_context_pool()
         except Exception as e:
             logger.error(f"启动 Playwright 浏览器失败: {e}")
 
+        # Warm up inline JS, HTML shell and default theme CSS caches
+        self._get_hljs_inline()
+        self._get_html_shell()
+        self._get_theme_css(self.config.get("default_theme", "github-dark") if self.config else "github-dark")
+
         # Clean up temp files on startup
         await self._cleanup_temp_files()
 
         # Start periodic cleanup task
-        asyncio.create_task(self._periodic_cleanup())
+        self._cleanup_task = asyncio.create_task(self._periodic_cleanup())
         
         logger.info(f"{len(self.custom_languages)} 个自定义语言已加载.")
 
-    def _find_cjk_font(self, font_size: int):
-        """Find available CJK font across platforms"""
-        system = platform.system()
-        font_names = []
-        font_dirs = []
-        
-        if system == "Windows":
-            font_names = ["msyh.ttc", "simhei.ttf", "simsun.ttc", "msjh.ttc"]
-            font_dirs = [os.path.join(os.environ.get("WINDIR", "C:\\Windows"), "Fonts")]
-        elif system == "Darwin": # macOS
-            font_names = ["PingFang.ttc", "STHeiti Light.ttc", "STHeiti Medium.ttc"]
-            font_dirs = ["/System/Library/Fonts", "/Library/Fonts", os.path.expanduser("~/Library/Fonts")]
-        else: # Linux / Other
-            # 优先尝试使用 fc-match (fontconfig)
+    async def _new_pool_slot(self) -> dict:
+        """创建一个池槽位：共享上下文中的常驻标签页 + 直连的 CDP 会话
+
+        多个标签页共享一个 BrowserContext，比每槽位独立上下文更省内存和启动开销。
+        """
+        page = await self._shared_context.new_page()
+        await page.goto("about:blank")
+        session = await self._shared_context.new_cdp_session(page)
+        await session.send("Page.enable")
+        frame_tree = await session.send("Page.getFrameTree")
+        frame_id = frame_tree["frameTree"]["frame"]["id"]
+        # 静态渲染壳只在建槽时加载一次，hljs 源码只被 V8 解析一次；
+        # 之后每次渲染仅通过 window.__render 换代码和主题
+        await session.send("Page.setDocumentContent", {
+            "frameId": frame_id,
+            "html": self._get_html_shell(),
+        })
+        return {"page": page, "session": session, "frame_id": frame_id}
+
+    async def _init_context_pool(self):
+        """创建预热的渲染槽位池，避免每次渲染都新建页面上下文"""
+        if self._context_pool is not None or not self._browser:
+            return
+        pool_size = self.config.get("render_pool_size", 4) if self.config else 4
+        if not isinstance(pool_size, int) or pool_size < 1:
+            pool_size = 4
+        if self._shared_context is None:
+            self._shared_context = await self._browser.new_context(viewport={"width": 1200, "height": 800})
+            # 渲染页所需资源全部内联或走 file://，远程子资源一律掐断，
+            # 避免用户代码里出现的 URL 触发 DNS/TLS 往返拖慢截图
+            await self._shared_context.route("**/*", self._block_remote_resources)
+        self._context_pool = asyncio.Queue(maxsize=pool_size)
+        self._context_pool_size = pool_size
+        for _ in range(pool_size):
+            self._context_pool.put_nowait(await self._new_pool_slot())
+        logger.info(f"CodeRender 渲染槽位池已就绪 (大小: {pool_size})")
+
+    @staticmethod
+    async def _block_remote_resources(route):
+        """掐断渲染页面发起的 http(s) 子资源请求（图片/字体/媒体/样式）"""
+        request = route.request
+        if (
+            request.resource_type in ("image", "font", "media", "stylesheet")
+            and request.url.startswith(("http://", "https://"))
+        ):
+            await route.abort()
+        else:
+            await route.continue_()
+
+    async def _acquire_context(self) -> dict:
+        """从池中取出一个渲染槽位；池未初始化时补救初始化
+
+        取到 None（惰性重建占位，见 _release_context）时现场重建槽位；
+        重建仍失败则放回占位并抛错，让本次渲染可见地失败而不是吞掉容量。
+        """
+        if self._context_pool is None:
+            await self._init_context_pool()
+        slot = await self._context_pool.get()
+        if slot is None:
             try:
-                # 查找支持中文的字体文件路径
-                output = subprocess.check_output(['fc-match', '-f', '%{file}', ':lang=zh'], stderr=subprocess.DEVNULL).decode().strip()
-                if output and os.path.exists(output):
-                    try:
-                        return ImageFont.truetype(output, font_size)
-                    except Exception:
-                        pass
+                slot = await self._new_pool_slot()
             except Exception:
-                pass
-
-            # 常见 Linux CJK 字体
-            font_names = [
-                "NotoSansSC-Regular.otf", "NotoSansCJK-Regular.ttc", 
-                "wqy-microhei.ttc", "wqy-zenhei.ttc",
-                "DroidSansFallback.ttf", "uming.ttc", "ukai.ttc"
-            ]
-            font_dirs = [
-                "/usr/share/fonts", 
-                "/usr/local/share/fonts", 
-                os.path.expanduser("~/.fonts"),
-                os.path.expanduser("~/.local/share/fonts")
-            ]
+                self._context_pool.put_nowait(None)
+                raise
+        return slot
 
-        # Search through directories
-        for directory in font_dirs:
-            if not os.path.exists(directory):
-                continue
-            for root, dirs, files in os.walk(directory):
-                for filename in files:
-                    # Exact match
-                    if filename in font_names:
-                        try:
-                            return ImageFont.truetype(os.path.join(root, filename), font_size)
-                        except Exception:
-                            continue
-                    # Fuzzy match for Noto Sans CJK
-                    if "NotoSansSC" in filename and filename.endswith((".otf", ".ttf", ".ttc")):
-                        try:
-                            return ImageFont.truetype(os.path.join(root, filename), font_size)
-                        except Exception:
-                            continue
+    async def _release_context(self, slot: dict, broken: bool = False):
+        """归还渲染槽位；出错的槽位丢弃并重建，保持池容量不变
 
-        # Fallback: Try loading by name directly (relies on system path configuration)
-        for name in font_names:
+        重建失败时放回 None 占位而不是丢弃名额，否则连续故障会让池
+        越缩越小，最终所有渲染都卡死在 _acquire_context 上。
+        """
+        if self._context_pool is None:
+            return
+        if broken:
             try:
-                return ImageFont.truetype(name, font_size)
+                await slot["page"].close()
             except Exception:
-                continue
-                
-        return None
+                pass
+            try:
+                slot = await self._new_pool_slot()
+            except Exception as e:
+                logger.error(f"重建渲染槽位失败，留待下次取用时重建: {e}")
+                slot = None
+        self._context_pool.put_nowait(slot)
 
     def _load_custom_languages(self):
-        """Load custom language definitions from languages folder for highlight.js registration"""
+        """Load custom language definitions from languages folder for highlight.js registration
+
+        Parsed definitions are cached in a pickle next to the JSON sources; the
+        cache is reused only when its format version and its recorded source
+        list (names and mtimes) match the directory exactly. The inverted
+        indexes are always rebuilt so standard_language_map stays current.
+        """
         plugin_dir = Path(__file__).parent
         languages_dir = plugin_dir / "languages"
-        
+
         if not languages_dir.exists():
             logger.info("languages directory does not exist, skipping custom language loading")
+            self._build_language_indexes()
             return
-        
+
         json_files = list(languages_dir.glob("*.json"))
         if not json_files:
             logger.info("No JSON files found in languages directory")
+            self._build_language_indexes()
             return
-        
+
+        cache_path = languages_dir / "languages.pkl"
+        # 源清单（文件名 + mtime）整体参与校验：仅比较最新 mtime 会漏掉
+        # 删除源文件的情况，让已移除的语言残留在缓存里
+        sources = sorted((f.name, f.stat().st_mtime) for f in json_files)
+        if cache_path.exists():
+            try:
+                cached = pickle.loads(cache_path.read_bytes())
+                if (
+                    cached.get("version") == _LANG_CACHE_VERSION
+                    and cached.get("sources") == sources
+                ):
+                    self.custom_languages = cached["custom_languages"]
+                    # 索引总是现算，standard_language_map 的代码改动立即生效
+                    self._build_language_indexes()
+                    return
+            except Exception as e:
+                logger.warning(f"读取语言定义缓存失败，回退到 JSON 解析: {e}")
+
         for json_file in json_files:
             try:
                 with open(json_file, "r", encoding="utf-8") as f:
@@ -230,41 +445,87 @@ class CodeRenderPlugin(Star):
             except Exception as e:
                 logger.error(f"Error loading {json_file.name}: {e}")
 
-    async def _cleanup_temp_files(self):
-        """Clean up temporary files"""
-        if not os.path.exists(self.temp_dir):
-            return
-        
+        self._build_language_indexes()
+
+        try:
+            cache_path.write_bytes(pickle.dumps({
+                "version": _LANG_CACHE_VERSION,
+                "sources": sources,
+                "custom_languages": self.custom_languages,
+            }, protocol=pickle.HIGHEST_PROTOCOL))
+        except Exception as e:
+            logger.warning(f"写入语言定义缓存失败: {e}")
+
+    def _build_language_indexes(self):
+        """Build O(1) inverted indexes for extension and alias lookups"""
+        ext_to_lang = dict(self.standard_language_map)
+        alias_to_lang = {}
+
+        # Custom language extensions take priority over the standard map
+        for lang_id, lang_def in self.custom_languages.items():
+            for ext in lang_def.get("extensions", []):
+                ext_to_lang[ext.lower()] = lang_id
+            for alias in lang_def.get("aliases", []):
+                alias_to_lang[alias.lower()] = lang_id
+
+        self._ext_to_lang = ext_to_lang
+        self._alias_to_lang = alias_to_lang
+
+    def _blocking_cleanup(self, max_age: float | None = None) -> int:
+        """Delete temp files synchronously; runs in a worker thread
+
+        With max_age set, only files whose mtime is older than that many
+        seconds are removed (entry.stat() reuses the scandir dirent data).
+        """
         count = 0
-        for filename in os.listdir(self.temp_dir):
-            file_path = os.path.join(self.temp_dir, filename)
-            try:
-                if os.path.isfile(file_path):
-                    os.remove(file_path)
-                    count += 1
-            except Exception as e:
-                logger.warning(f"Failed to delete temporary file {filename}: {e}")
-        
+        cutoff = (time.time() - max_age) if max_age is not None else None
+        try:
+            with os.scandir(self.temp_dir) as it:
+                for entry in it:
+                    try:
+                        if not entry.is_file():
+                            continue
+                        if cutoff is not None and entry.stat().st_mtime >= cutoff:
+                            continue
+                        os.remove(entry.path)
+                        count += 1
+                    except OSError as e:
+                        logger.warning(f"Failed to delete temporary file {entry.name}: {e}")
+        except FileNotFoundError:
+            pass
+        return count
+
+    async def _cleanup_temp_files(self, max_age: float | None = None):
+        """Clean up temporary files without blocking the event loop"""
+        count = await asyncio.to_thread(self._blocking_cleanup, max_age)
         if count > 0:
             logger.info(f"Cleaned up {count} temporary files")
 
     async def _periodic_cleanup(self):
-        """Periodically clean up temporary files older than 1 hour"""
-        while True:
+        """Periodically clean up temporary files older than 1 hour
+
+        Waits on the stop event so terminate() can drain the task promptly
+        instead of leaving it asleep until the next tick.
+        """
+        while not self._stop_event.is_set():
             try:
-                await asyncio.sleep(900)  # Check every 15 minutes
-                await self._cleanup_temp_files()
-            except Exception as e:
-                logger.error(f"Error during periodic temp file cleanup: {e}")
+                await asyncio.wait_for(self._stop_event.wait(), timeout=900)
+            except asyncio.TimeoutError:
+                try:
+                    await self._cleanup_temp_files(max_age=3600)
+                except Exception as e:
+                    logger.error(f"Error during periodic temp file cleanup: {e}")
 
     async def _ensure_playwright_browser(self):
-        """Ensure Playwright browser is installed and available"""
+        """Ensure Playwright browser is installed and available (verified once per process)"""
+        if self._browser_verified:
+            return
         try:
             from playwright.async_api import async_playwright as _ap
 
             async with _ap() as p:
                 try:
-                    browser = await p.chromium.launch(headless=True)
+                    browser = await p.chromium.launch(headless=True, args=CHROMIUM_LAUNCH_ARGS)
                     await browser.close()
                     #logger.info("Playwright Chromium 浏览器已就绪")
                 except Exception as e:
@@ -280,6 +541,8 @@ class CodeRenderPlugin(Star):
                     else:
                         logger.error(f"Failed to automatically install Playwright browser: {result.stderr}")
                         logger.error("Please run manually: playwright install chromium")
+                        return
+            self._browser_verified = True
         except Exception as e:
             logger.error(f"Error checking Playwright browser: {e}")
             logger.error("If this is the first time using, please run manually: playwright install chromium")
@@ -294,51 +557,136 @@ class CodeRenderPlugin(Star):
 
     def _detect_language(self, code: str, hint: str = None, filename: str = None) -> str:
         """Detect code language - now fully relies on highlight.js auto-detection, only handles hints and file extensions"""
-        # If language hint is provided, return it directly (let highlight.js handle it)
+        # If language hint is provided, resolve custom aliases then pass it through
+        # (highlight.js handles standard names/aliases itself)
         if hint:
-            return hint.lower().strip()
+            hint = hint.lower().strip()
+            return self._alias_to_lang.get(hint, hint)
         
-        # 如果提供了文件名，尝试匹配扩展名
+        # 如果提供了文件名，优先匹配扩展名（自定义语言已在索引中覆盖标准映射）
         if filename:
             ext = os.path.splitext(filename)[1].lower()
-            
-            # 优先检查自定义语言的扩展名
-            for lang_id, lang_def in self.custom_languages.items():
-                if ext in lang_def.get("extensions", []):
-                    return lang_id
-            
-            # 检查标准语言映射
-            if ext in self.standard_language_map:
-                return self.standard_language_map[ext]
-        
+            lang = self._ext_to_lang.get(ext)
+            if lang:
+                return lang
+
+        # 扩展名未知时按编译好的特征签名粗筛（按代码开头做 LRU 缓存）
+        sig_lang = _sig_scan(code[:4096])
+        if sig_lang:
+            return sig_lang
+
+        # 仍无法判定则交给 highlight.js 客户端自动检测
         return None
 
     def _get_lexer(self, language: str, code: str):
         """获取 Pygments 语法高亮器（仅用于旧的图片渲染方式）"""
         # Pygments lexer 仅在不使用 Playwright 时需要
+        from pygments.lexers import guess_lexer
+        from pygments.util import ClassNotFound
         try:
-            return get_lexer_by_name(language, stripall=True)
+            return _cached_lexer(language)
         except ClassNotFound:
-            # 尝试猜测
+            # 先用快速签名粗筛，避免 guess_lexer 对全部 lexer 逐一打分
+            sig_lang = _sig_scan(code[:4096])
+            if sig_lang:
+                try:
+                    return _cached_lexer(sig_lang)
+                except ClassNotFound:
+                    pass
+            # 尝试猜测：guess_lexer 会对全部 lexer 跑 analyse_text，
+            # 只喂前 4KB 采样即可判型，避免大文件 O(长度×lexer 数) 的扫描
             try:
-                return guess_lexer(code)
+                return guess_lexer(code[:4096])
             except ClassNotFound:
-                return get_lexer_by_name("text", stripall=True)
+                return _cached_lexer("text")
+
+    def _get_hljs_inline(self) -> str:
+        """获取内联注入页面的 JS（highlight.js + 行号插件 + 自定义语言注册），只读盘一次"""
+        if self._hljs_inline_cache is not None:
+            return self._hljs_inline_cache
+
+        plugin_dir = os.path.dirname(__file__)
+
+        # highlight.js 路径（可通过配置覆盖），读取源码内联避免 file:// 外链脚本不执行
+        if self.config and self.config.get("highlight_js_path"):
+            hljs_path = self.config.get("highlight_js_path")
+        else:
+            hljs_path = os.path.join(plugin_dir, "assets", "highlight", "highlight.min.js")
+
+        hljs_source = ""
+        try:
+            with open(hljs_path, "r", encoding="utf-8") as f:
+                hljs_source = f.read()
+        except Exception as e:
+            logger.error(f"读取 highlight.js 失败: {e}")
+
+        # 行号插件源码
+        lnjs_source = ""
+        try:
+            lnjs_path = os.path.join(plugin_dir, "assets", "line-number", "line-number.js")
+            if os.path.exists(lnjs_path):
+                with open(lnjs_path, "r", encoding="utf-8") as f:
+                    lnjs_source = f.read()
+        except Exception as e:
+            logger.error(f"读取行号插件失败: {e}")
+
+        # 避免内联脚本中出现 </script> 终止标签
+        full_hljs_source = (hljs_source or '') + (lnjs_source or '')
+        self._hljs_inline_cache = full_hljs_source.replace("</script>", "<\\/script>") if full_hljs_source else ""
+        return self._hljs_inline_cache
+
+    def _get_custom_lang_script(self, language: str) -> str:
+        """仅当目标语言是自定义语言时，返回其 hljs 注册脚本（按语言缓存）
+
+        99% 的渲染不涉及自定义语言，注册脚本不必塞进每个页面让 V8 白白解析。
+        """
+        if not language or not self.custom_languages:
+            return ""
+        lang_id = self._alias_to_lang.get(language, language)
+        if lang_id not in self.custom_languages:
+            return ""
+        script = self._custom_lang_script_cache.get(lang_id)
+        if script is None:
+            # 脚本经 __render 里的 eval 执行而非内联进 HTML，无需转义 </script>
+            script = self._convert_to_hljs_definition(lang_id, self.custom_languages[lang_id])
+            self._custom_lang_script_cache[lang_id] = script
+        return script
+
+    def _get_theme_css(self, theme_name: str) -> str:
+        """获取主题 CSS 文本，按主题名缓存，避免每次渲染重复读盘"""
+        cached = self._theme_css_cache.get(theme_name)
+        if cached is not None:
+            return cached
+
+        plugin_dir = os.path.dirname(__file__)
+        if self.config and self.config.get("highlight_css_path"):
+            hljs_css_path = self.config.get("highlight_css_path")
+        else:
+            # 根据主题名自动匹配 styles 目录下的 CSS 文件，例如 monokai -> monokai.min.css
+            css_filename = f"{theme_name}.min.css"
+            hljs_css_path = os.path.join(plugin_dir, "assets", "highlight", "styles", css_filename)
+
+        hljs_theme_css = ""
+        try:
+            if os.path.exists(hljs_css_path):
+                with open(hljs_css_path, "r", encoding="utf-8") as f:
+                    hljs_theme_css = f.read()
+        except Exception as e:
+            logger.error(f"读取 highlight.js 主题 CSS 失败: {e}")
+
+        self._theme_css_cache[theme_name] = hljs_theme_css
+        return hljs_theme_css
+
+    def _resolve_font(self):
+        """解析字体配置为 @font-face CSS 与 font-family，结果缓存（配置在运行期不变）
+
+        优先级：config.font_path > 插件内 JetBrainsMono-Regular.ttf > 浏览器系统字体
+        """
+        if self._font_face_css is not None:
+            return
 
-    async def _render_code_to_image(
-        self,
-        code: str,
-        language: str,
-        theme_override: str = None,
-        font_size_override: int = None,
-        line_numbers_override: bool = None,
-    ) -> str:
-        """使用 Playwright + 本地 highlight.js 模板渲染代码为图片"""
-        theme_name = theme_override or (self.config.get("default_theme", "github-dark") if self.config else "github-dark")
-        font_size = font_size_override or (self.config.get("font_size", 14) if self.config else 14)
         plugin_dir = os.path.dirname(__file__)
 
-        # 字体配置：config.font_path > 插件内 JetBrainsMono-Regular.ttf > 浏览器系统字体
         font_path = None
         if self.config and self.config.get("font_path"):
             font_path = self.config.get("font_path")
@@ -365,83 +713,24 @@ class CodeRenderPlugin(Star):
         """
             font_family = "CodeRenderFont"
 
-        # highlight.js 与主题 CSS 路径（可通过配置覆盖）
-        if self.config and self.config.get("highlight_js_path"):
-            hljs_path = self.config.get("highlight_js_path")
-        else:
-            # 默认使用插件目录下解压的 highlight.min.js
-            hljs_path = os.path.join(plugin_dir, "assets", "highlight", "highlight.min.js")
+        self._font_face_css = font_face_css
+        self._font_family = font_family
 
-        if self.config and self.config.get("highlight_css_path"):
-            hljs_css_path = self.config.get("highlight_css_path")
-        else:
-            # 根据主题名自动匹配 styles 目录下的 CSS 文件，例如 monokai -> monokai.min.css
-            css_filename = f"{theme_name}.min.css"
-            hljs_css_path = os.path.join(plugin_dir, "assets", "highlight", "styles", css_filename)
-
-        # 读取主题 CSS，如果存在则使用；否则使用内置深色主题作为回退
-        hljs_theme_css = ""
-        try:
-            if os.path.exists(hljs_css_path):
-                with open(hljs_css_path, "r", encoding="utf-8") as f:
-                    hljs_theme_css = f.read()
-        except Exception as e:
-            logger.error(f"读取 highlight.js 主题 CSS 失败: {e}")
-            hljs_theme_css = ""
-
-        # 读取 highlight.js 源码内联到页面中，避免 file:// 外链脚本不执行
-        hljs_source = ""
-        try:
-            with open(hljs_path, "r", encoding="utf-8") as f:
-                hljs_source = f.read()
-        except Exception as e:
-            logger.error(f"读取 highlight.js 失败: {e}")
-            hljs_source = ""
-
-        # 读取行号插件源码
-        lnjs_source = ""
-        try:
-            lnjs_path = os.path.join(plugin_dir, "assets", "line-number", "line-number.js")
-            if os.path.exists(lnjs_path):
-                with open(lnjs_path, "r", encoding="utf-8") as f:
-                    lnjs_source = f.read()
-        except Exception as e:
-            logger.error(f"读取行号插件失败: {e}")
-            lnjs_source = ""
-
-        custom_lang_scripts = self._generate_hljs_language_registrations()
+    def _get_html_shell(self) -> str:
+        """预构建常驻渲染页的静态外壳 HTML，每个池槽位只加载一次
 
-        # 避免内联脚本中出现 </script> 终止标签
-        full_hljs_source = (hljs_source or '') + (lnjs_source or '') + custom_lang_scripts
-        hljs_inline = full_hljs_source.replace("</script>", "<\\/script>") if full_hljs_source else ""
+        外壳内含字体、hljs 源码与 window.__render 入口；每次渲染不再重发整份
+        文档，只通过一次 Runtime.evaluate 调 __render 换主题 CSS、代码与高亮。
+        """
+        if self._html_shell_cache is not None:
+            return self._html_shell_cache
 
-        # 将代码安全转义后塞进 template
-        escaped_code = html.escape(code)
-        language_class = language if language else ""
+        self._resolve_font()
+        font_family = self._font_family
+        hljs_inline = self._get_hljs_inline()
+        font_face_css = self._font_face_css
 
-        # 行号配置
-        use_line_numbers = (
-            line_numbers_override
-            if line_numbers_override is not None
-            else (self.config.get("line_numbers_enabled", True) if self.config else True)
-        )
-        start_from = (
-            self.config.get("line_numbers_start_from", 1)
-            if (self.config and isinstance(self.config.get("line_numbers_start_from", 1), int))
-            else 1
-        )
-        single_line = (
-            self.config.get("line_numbers_single_line", False)
-            if self.config
-            else False
-        )
-        ln_width = None
-        if self.config:
-            w = self.config.get("line_numbers_width", None)
-            if isinstance(w, int) and w > 0:
-                ln_width = w
-
-        html_content = f"""<!DOCTYPE html>
+        self._html_shell_cache = f"""<!DOCTYPE html>
 <html>
 <head>
     <meta charset="utf-8" />
@@ -457,7 +746,7 @@ class CodeRenderPlugin(Star):
     }}
     pre {{
         margin: 0;
-        font-size: {font_size}px;
+        font-size: 14px;
         line-height: 1.5;
         font-family: {font_family};
         white-space: pre-wrap;
@@ -472,72 +761,130 @@ class CodeRenderPlugin(Star):
         width: fit-content;
         max-width: 1100px;
     }}
-    {hljs_theme_css}
     </style>
+    <style id="theme-css"></style>
     <script>{hljs_inline}</script>
-    <script>
-    (function () {{
-        var ENABLE_LINE_NUMBERS = {str(bool(use_line_numbers)).lower()};
-        var LN_OPTIONS = {{ startFrom: {start_from}, singleLine: {str(bool(single_line)).lower()}, lineNumberWidth: {ln_width if ln_width is not None else 'null'} }};
-        function applyHighlight() {{
-            const blocks = document.querySelectorAll('pre code');
-            for (const block of blocks) {{
-                try {{
-                    if (!window.hljs) {{
-                        console.error('highlight.js not loaded');
-                        continue;
-                    }}
-                    
-                    const classes = Array.from(block.classList);
-                    const hasLanguage = classes.some(cls => cls.startsWith('language-') && cls !== 'language-');
-                    
-                    if (hasLanguage) {{
-                        window.hljs.highlightElement(block);
-                    }} else {{
-                        const result = window.hljs.highlightAuto(block.textContent);
-                        block.innerHTML = result.value;
-                        block.className = 'hljs ' + result.language;
-                    }}
-                    if (ENABLE_LINE_NUMBERS && window.hljs && typeof window.hljs.lineNumbersBlock === 'function') {{
-                        window.hljs.lineNumbersBlock(block, LN_OPTIONS);
-                    }}
-                }} catch (e) {{
-                    console.error('highlight.js error', e);
-                }}
-            }}
-        }}
-
-        function waitForHLJS(retry) {{
-            retry = retry || 0;
-            if (window.hljs && typeof window.hljs.highlightElement === 'function') {{
-                applyHighlight();
-            }} else if (retry < 100) {{
-                setTimeout(function () {{ waitForHLJS(retry + 1); }}, 50);
-            }} else {{
-                console.warn('highlight.js not available after waiting');
-            }}
-        }}
-
-        if (document.readyState === 'complete' || document.readyState === 'interactive') {{
-            waitForHLJS(0);
-        }} else {{
-            document.addEventListener('DOMContentLoaded', function () {{ waitForHLJS(0); }});
-        }}
-    }})();
-    </script>
+    <script>{RENDER_FN_JS}</script>
 </head>
 <body>
     <div class="code-container">
-        <pre><code class="hljs{' language-' + language_class if language_class else ''}">{escaped_code}</code></pre>
+        <pre><code id="code" class="hljs"></code></pre>
     </div>
 </body>
 </html>
 """
+        return self._html_shell_cache
 
-        filename = f"{uuid.uuid4().hex}.png"
-        file_path = os.path.join(self.temp_dir, filename)
+    def _render_code_to_image_fast(
+        self,
+        code: str,
+        language: str,
+        theme_name: str,
+        font_size: int,
+        line_numbers: bool,
+    ) -> bytes:
+        """Pygments ImageFormatter（Pillow）直接栅格化代码，绕开浏览器
 
-        await self._ensure_playwright_browser()
+        输出不如 highlight.js 模板精致，仅作为浏览器不可用时的回退路径。
+        主题名按 Pygments style 解析，hljs 专有主题回退到 monokai。
+        """
+        from pygments import highlight
+        from pygments.formatters import ImageFormatter
+
+        lexer = self._get_lexer(language or "text", code)
+        # ImageFormatter 不能跨渲染复用：format() 只会往 drawables 追加，
+        # 复用会把上一次的文字叠进新图；style/lexer 缓存已覆盖大头开销
+        formatter = ImageFormatter(
+            style=_resolve_pygments_style(theme_name),
+            font_size=font_size,
+            line_numbers=line_numbers,
+            image_format="PNG",
+        )
+        return highlight(code, lexer, formatter)
+
+    async def _render_code_to_image(
+        self,
+        code: str,
+        language: str,
+        theme_override: str = None,
+        font_size_override: int = None,
+        line_numbers_override: bool = None,
+    ) -> bytes:
+        """使用 Playwright + 本地 highlight.js 模板渲染代码为图片，返回 PNG 字节"""
+        theme_name = theme_override or self._cfg_default_theme
+        font_size = font_size_override or self._cfg_font_size
+
+        hljs_theme_css = self._get_theme_css(theme_name)
+        language_class = language if language else ""
+
+        # 行号配置（默认值在 __init__ 时从 config 提升为属性）
+        use_line_numbers = (
+            line_numbers_override
+            if line_numbers_override is not None
+            else self._cfg_ln_enabled
+        )
+        start_from = self._cfg_ln_start
+        single_line = self._cfg_ln_single
+        ln_width = self._cfg_ln_width
+
+        # 相同代码/参数的重复渲染直接走缓存，省掉整次 Chromium 渲染
+        cache_key = hashlib.blake2b(
+            repr((code, language_class, theme_name, font_size,
+                  use_line_numbers, start_from, single_line, ln_width)).encode(),
+            digest_size=16,
+        ).digest()
+        cached_png = self._render_cache.get(cache_key)
+        if cached_png is not None:
+            self._render_cache.move_to_end(cache_key)
+            return cached_png
+
+        # single-flight：相同参数的并发请求合并到同一次渲染，
+        # 后到者直接等首个任务的结果而不是各自占用一个槽位
+        task = self._inflight.get(cache_key)
+        if task is None:
+            task = asyncio.create_task(self._render_uncached(
+                code, language, hljs_theme_css, theme_name, font_size,
+                use_line_numbers, start_from, single_line, ln_width, cache_key,
+            ))
+            self._inflight[cache_key] = task
+            task.add_done_callback(lambda _t, k=cache_key: self._inflight.pop(k, None))
+        # shield：单个等待方被取消不应中断其余等待方共享的渲染
+        return await asyncio.shield(task)
+
+    async def _render_uncached(
+        self,
+        code: str,
+        language: str,
+        hljs_theme_css: str,
+        theme_name: str,
+        font_size: int,
+        use_line_numbers: bool,
+        start_from: int,
+        single_line: bool,
+        ln_width: int | None,
+        cache_key: bytes,
+    ) -> bytes:
+        """执行一次真实渲染（缓存未命中时由 single-flight 任务调用）"""
+        language_class = language if language else ""
+
+        # 短行代码用 white-space: pre，省掉 Chromium 的断行/回流计算。
+        # 最长行宽按字号折算成像素，与容器可用宽度（max-width 1100px 减去
+        # 左右内边距）比较，避免 pre 溢出容器被截图裁剪掉右边缘
+        needs_wrap = _max_line_em_width(code) * font_size > 1060
+
+        # __render 的参数走 JSON 注入，代码经 textContent 赋值不可能破坏页面结构
+        render_opts = {
+            "code": code,
+            "language": language_class,
+            "wrap": needs_wrap,
+            "themeCss": hljs_theme_css,
+            "customLangJs": self._get_custom_lang_script(language_class),
+            "fontSize": font_size,
+            "lineNumbers": bool(use_line_numbers),
+            "lnStart": start_from,
+            "lnSingle": bool(single_line),
+            "lnWidth": ln_width,
+        }
 
         # 使用共享浏览器实例渲染截图
         if not self._browser:
@@ -545,24 +892,115 @@ class CodeRenderPlugin(Star):
             try:
                 if not self._playwright:
                     self._playwright = await async_playwright().start()
-                self._browser = await self._playwright.chromium.launch(headless=True)
+                self._browser = await self._playwright.chromium.launch(headless=True, args=CHROMIUM_LAUNCH_ARGS)
                 logger.info("CodeRender Playwright 浏览器在渲染时重新启动")
             except Exception as e:
-                logger.error(f"渲染时启动 Playwright 浏览器失败: {e}")
-                raise
+                # 浏览器彻底不可用时退化为 Pygments/Pillow 直接栅格化。
+                # 降级结果不写入缓存：浏览器恢复后同样的代码应重走高质量路径，
+                # 而不是从 LRU 里一直拿到回退图
+                logger.error(f"渲染时启动 Playwright 浏览器失败，使用快速渲染回退: {e}")
+                return await asyncio.to_thread(
+                    self._render_code_to_image_fast,
+                    code, language, theme_name, font_size, bool(use_line_numbers),
+                )
 
-        page = await self._browser.new_page(viewport={"width": 1200, "height": 800})
-        await page.set_content(html_content, wait_until="networkidle")
-        
-        element = await page.query_selector('.code-container')
-        if element:
-            await element.screenshot(path=file_path)
+        slot = await self._acquire_context()
+        try:
+            session = slot["session"]
+            # 页面外壳在建槽时已加载，这里只需一次同步的 __render 调用
+            render_result = await session.send("Runtime.evaluate", {
+                "expression": "window.__render(" + json.dumps(render_opts) + ")",
+                "returnByValue": True,
+            })
+            # __render 抛错或未返回 true（如外壳未加载成功）时必须失败，
+            # 否则会把槽位里上一次的页面内容截成图并写进缓存
+            exception_details = render_result.get("exceptionDetails")
+            if exception_details:
+                raise RuntimeError(
+                    f"页面渲染脚本执行失败: {exception_details.get('text', exception_details)}"
+                )
+            if render_result.get("result", {}).get("value") is not True:
+                raise RuntimeError("页面渲染脚本未正常完成")
+
+            # 量取 .code-container 的包围盒作为截图裁剪区域；
+            # 容器缺失时量取文档尺寸，避免 Chromium 的整页测量路径
+            measure = await session.send("Runtime.evaluate", {
+                "expression": (
+                    "(() => { const el = document.querySelector('.code-container');"
+                    " if (el) { const r = el.getBoundingClientRect();"
+                    "   return JSON.stringify({x: r.x, y: r.y, width: Math.ceil(r.width), height: Math.ceil(r.height)}); }"
+                    " const d = document.documentElement;"
+                    " return JSON.stringify({x: 0, y: 0,"
+                    "   width: Math.ceil(d.scrollWidth), height: Math.ceil(d.scrollHeight)}); })()"
+                ),
+                "returnByValue": True,
+            })
+            rect_json = measure.get("result", {}).get("value")
+
+            image_format = self._cfg_image_format
+            capture_params = {"format": image_format, "captureBeyondViewport": True}
+            if image_format in ("webp", "jpeg"):
+                capture_params["quality"] = 92
+            if rect_json:
+                rect = json.loads(rect_json)
+                if rect.get("width") and rect.get("height"):
+                    capture_params["clip"] = {
+                        "x": rect["x"],
+                        "y": rect["y"],
+                        "width": rect["width"],
+                        "height": rect["height"],
+                        "scale": 1,
+                    }
+
+            result = await session.send("Page.captureScreenshot", capture_params)
+            png_bytes = base64.b64decode(result["data"])
+        except Exception:
+            await self._release_context(slot, broken=True)
+            raise
         else:
-            await page.screenshot(path=file_path, full_page=True)
-        
-        await page.close()
+            await self._release_context(slot)
+
+        self._render_cache[cache_key] = png_bytes
+        while len(self._render_cache) > self._render_cache_max:
+            self._render_cache.popitem(last=False)
 
-        return file_path
+        return png_bytes
+
+    async def _read_code_file(self, file_path: str) -> str | None:
+        """读取代码文件：一次性读入字节后解码，失败编码不再整文件重读
+
+        解码顺序：BOM 判定 → UTF-8 → charset_normalizer 探测（如已安装）→ GBK。
+        全部失败返回 None。
+        """
+        raw = await asyncio.to_thread(Path(file_path).read_bytes)
+
+        # BOM 开头的文件直接定编码，跳过后面的试错链
+        if raw.startswith(b"\xef\xbb\xbf"):
+            return raw.decode("utf-8-sig")
+        if raw.startswith((b"\xff\xfe", b"\xfe\xff")):
+            return raw.decode("utf-16")
+
+        try:
+            return raw.decode("utf-8")
+        except UnicodeDecodeError:
+            pass
+
+        try:
+            from charset_normalizer import from_bytes
+            best = from_bytes(raw).best()
+            if best is not None:
+                return str(best)
+        except ImportError:
+            pass
+
+        try:
+            return raw.decode("gbk")
+        except UnicodeDecodeError:
+            return None
+
+    def _image_component(self, image_bytes: bytes) -> ImageComponent:
+        """将图片字节包装为图片消息组件（base64 内联，免临时文件落盘）"""
+        return ImageComponent(file="base64://" + base64.b64encode(image_bytes).decode())
 
     def _parse_render_args(self, args_str: str) -> dict:
         """解析渲染参数
@@ -591,48 +1029,47 @@ class CodeRenderPlugin(Star):
         parts = args_str.split()
         remaining_parts = []
         i = 0
-        
-        while i < len(parts):
+        n = len(parts)
+
+        while i < n:
             part = parts[i]
-            
-            # 解析 lang= 或 -l
-            if part.startswith("lang="):
-                result["language"] = part[5:]
-            elif part == "-l" and i + 1 < len(parts):
-                i += 1
-                result["language"] = parts[i]
-            # 解析 theme= 或 -t
-            elif part.startswith("theme="):
-                result["theme"] = part[6:]
-            elif part == "-t" and i + 1 < len(parts):
-                i += 1
-                result["theme"] = parts[i]
-            # 解析 size= 或 -s
-            elif part.startswith("size="):
-                try:
-                    result["font_size"] = int(part[5:])
-                except ValueError:
-                    pass
-            elif part == "-s" and i + 1 < len(parts):
-                i += 1
-                try:
-                    result["font_size"] = int(parts[i])
-                except ValueError:
-                    pass
-            # 解析行号开关
-            elif part in ("noline", "-n", "--no-line"):
-                result["line_numbers"] = False
-            elif part in ("line", "-ln", "--line"):
-                result["line_numbers"] = True
+
+            # 按分发表 O(1) 命中，不再对每个 token 走整条 if/elif 链
+            key = _ARG_VALUE_FLAGS.get(part)
+            if key is not None:
+                if i + 1 < n:
+                    i += 1
+                    self._assign_render_arg(result, key, parts[i])
+                else:
+                    # 末尾的孤立 flag 不是参数，保持旧行为归入剩余部分
+                    remaining_parts.append(part)
+            elif part in _ARG_TOGGLES:
+                result["line_numbers"] = _ARG_TOGGLES[part]
             else:
-                # 不是参数，加入剩余部分
-                remaining_parts.append(part)
-            
+                eq = part.find("=")
+                key = _ARG_PREFIXES.get(part[:eq + 1]) if eq > 0 else None
+                if key is not None:
+                    self._assign_render_arg(result, key, part[eq + 1:])
+                else:
+                    # 不是参数，加入剩余部分
+                    remaining_parts.append(part)
+
             i += 1
-        
+
         result["remaining"] = " ".join(remaining_parts)
         return result
 
+    @staticmethod
+    def _assign_render_arg(result: dict, key: str, value: str):
+        """写入一个解析到的渲染参数，字号做整数转换（非法值忽略）"""
+        if key == "font_size":
+            try:
+                result[key] = int(value)
+            except ValueError:
+                pass
+        else:
+            result[key] = value
+
     @filter.command("render")
     async def render_code(
         self,
@@ -724,7 +1161,7 @@ class CodeRenderPlugin(Star):
         # 提取代码
         code, detected_lang = self._extract_code_from_message(reply_message)
         
-        if not code or len(code.strip()) == 0:
+        if not code or code.isspace():
             yield event.plain_result("❌ 未能从消息中提取到代码")
             return
         
@@ -736,35 +1173,35 @@ class CodeRenderPlugin(Star):
         
         # 获取语言显示名称
         lang_display = final_language
-        theme_display = final_theme or (self.config.get("theme", "monokai") if self.config else "monokai")
+        theme_display = final_theme or self._default_theme_display
         
         try:
             # 发送处理中提示
             # yield event.plain_result(f"🎨 正在渲染 {lang_display} 代码 (主题: {theme_display})...")
             
             # 渲染代码
-            image_path = await self._render_code_to_image(
-                code, 
+            png_bytes = await self._render_code_to_image(
+                code,
                 final_language,
                 theme_override=final_theme,
                 font_size_override=final_size,
                 line_numbers_override=final_line_numbers
             )
-            
-            if not os.path.exists(image_path):
+
+            if not png_bytes:
                 yield event.plain_result("❌ 渲染失败：图片生成失败")
                 return
-            
+
             # 发送图片
             result = MessageEventResult()
-            result.chain.append(ImageComponent(file=image_path))
-            
+            result.chain.append(self._image_component(png_bytes))
+
             yield result
             
-            logger.info(f"代码渲染成功: {lang_display}, 主题: {theme_display}, {len(code)} 字符")
+            logger.info("代码渲染成功: %s, 主题: %s, %d 字符", lang_display, theme_display, len(code))
             
         except Exception as e:
-            logger.error(f"渲染代码时发生错误: {e}")
+            logger.error("渲染代码时发生错误: %s", e)
             yield event.plain_result(f"❌ 渲染失败: {str(e)}")
 
 
@@ -834,21 +1271,15 @@ class CodeRenderPlugin(Star):
                 
             # 读取文件内容
             try:
-                with open(file_path, "r", encoding="utf-8") as f:
-                    code = f.read()
-            except UnicodeDecodeError:
-                # 尝试其他编码
-                try:
-                    with open(file_path, "r", encoding="gbk") as f:
-                        code = f.read()
-                except Exception:
-                    yield event.plain_result("❌ 文件编码不支持 (仅支持 UTF-8 和 GBK)")
-                    return
+                code = await self._read_code_file(file_path)
             except Exception as e:
                 yield event.plain_result(f"❌ 读取文件失败: {str(e)}")
                 return
+            if code is None:
+                yield event.plain_result("❌ 文件编码不支持")
+                return
             
-            if not code or len(code.strip()) == 0:
+            if not code or code.isspace():
                 yield event.plain_result("❌ 文件内容为空")
                 return
 
@@ -858,30 +1289,30 @@ class CodeRenderPlugin(Star):
             
             # 获取显示名称
             lang_display = final_language
-            theme_display = final_theme or (self.config.get("theme", "monokai") if self.config else "monokai")
+            theme_display = final_theme or self._default_theme_display
 
             # 渲染
-            image_path = await self._render_code_to_image(
+            png_bytes = await self._render_code_to_image(
                 code,
                 final_language,
                 theme_override=final_theme,
                 font_size_override=final_size,
                 line_numbers_override=final_line_numbers
             )
-            
-            if not os.path.exists(image_path):
+
+            if not png_bytes:
                 yield event.plain_result("❌ 渲染失败：图片生成失败")
                 return
-            
+
             # 发送图片
             result = MessageEventResult()
-            result.chain.append(ImageComponent(file=image_path))
+            result.chain.append(self._image_component(png_bytes))
             yield result
             
-            logger.info(f"文件渲染成功: {file_name}, 语言: {lang_display}, 主题: {theme_display}")
+            logger.info("文件渲染成功: %s, 语言: %s, 主题: %s", file_name, lang_display, theme_display)
             
         except Exception as e:
-            logger.error(f"处理文件渲染时发生错误: {e}")
+            logger.error("处理文件渲染时发生错误: %s", e)
             yield event.plain_result(f"❌ 处理失败: {str(e)}")
 
     @filter.llm_tool(name="render_code_to_image")
@@ -896,36 +1327,36 @@ class CodeRenderPlugin(Star):
             language(str): 代码语言. 建议填写。
             theme(str): 主题名称. 建议为idea-light
         """
-        if not code or not code.strip():
+        if not code or code.isspace():
             logger.warning("代码不能为空")
             yield event.plain_result("❌ 代码不能为空")
             return
             
-        logger.info(f"正在渲染代码: language={language}, theme={theme}")
+        logger.info("正在渲染代码: language=%s, theme=%s", language, theme)
         
         try:
             # 渲染代码为图片
-            image_path = await self._render_code_to_image(
+            png_bytes = await self._render_code_to_image(
                 code=code,
                 language=language,
                 theme_override=theme,
                 line_numbers_override=True
             )
-            
-            if not os.path.exists(image_path):
+
+            if not png_bytes:
                 logger.error("渲染失败：图片生成失败")
                 yield event.plain_result("❌ 代码渲染失败：无法生成图片")
                 return
-            
+
             # 发送图片
             result = MessageEventResult()
-            result.chain.append(ImageComponent(file=image_path))
-            
-            logger.info(f"代码渲染成功: {len(code)} 字符")
+            result.chain.append(self._image_component(png_bytes))
+
+            logger.info("代码渲染成功: %d 字符", len(code))
             yield result
             
         except Exception as e:
-            logger.error(f"渲染代码时发生错误: {e}")
+            logger.error("渲染代码时发生错误: %s", e)
             yield event.plain_result(f"❌ 渲染失败: {str(e)}")
     
     @filter.llm_tool(name="render_file_to_image")
@@ -959,41 +1390,48 @@ class CodeRenderPlugin(Star):
             if not file_path or not os.path.exists(file_path):
                 yield event.plain_result("❌ 文件获取失败")
                 return
-            try:
-                with open(file_path, "r", encoding="utf-8") as f:
-                    code = f.read()
-            except UnicodeDecodeError:
-                try:
-                    with open(file_path, "r", encoding="gbk") as f:
-                        code = f.read()
-                except Exception:
-                    yield event.plain_result("❌ 文件编码不支持 (仅支持 UTF-8 和 GBK)")
-                    return
-            if not code or len(code.strip()) == 0:
+            code = await self._read_code_file(file_path)
+            if code is None:
+                yield event.plain_result("❌ 文件编码不支持")
+                return
+            if not code or code.isspace():
                 yield event.plain_result("❌ 文件内容为空")
                 return
             final_language = language or self._detect_language(code, filename=file_name)
-            image_path = await self._render_code_to_image(
+            png_bytes = await self._render_code_to_image(
                 code=code,
                 language=final_language,
                 theme_override=theme,
                 line_numbers_override=True
             )
-            if not os.path.exists(image_path):
+            if not png_bytes:
                 yield event.plain_result("❌ 渲染失败：图片生成失败")
                 return
-            result.chain.append(ImageComponent(file=image_path))
+            result.chain.append(self._image_component(png_bytes))
             yield result
         except Exception as e:
-            logger.error(f"渲染文件时发生错误: {e}")
+            logger.error("渲染文件时发生错误: %s", e)
             yield event.plain_result(f"❌ 渲染失败: {str(e)}")
     
-    async def terminate(self):
-        """插件销毁时清理"""
-        # 先清理临时文件
-        await self._cleanup_temp_files()
+    async def _close_browser(self):
+        """关闭渲染槽位池、共享上下文与浏览器"""
+        if self._context_pool is not None:
+            while not self._context_pool.empty():
+                try:
+                    slot = self._context_pool.get_nowait()
+                    if slot is not None:  # None 为惰性重建占位
+                        await slot["page"].close()
+                except Exception:
+                    pass
+            self._context_pool = None
+
+        if self._shared_context is not None:
+            try:
+                await self._shared_context.close()
+            except Exception:
+                pass
+            self._shared_context = None
 
-        # 关闭 Playwright 浏览器
         try:
             if self._browser:
                 await self._browser.close()
@@ -1002,6 +1440,28 @@ class CodeRenderPlugin(Star):
         except Exception as e:
             logger.error(f"关闭 Playwright 浏览器时出错: {e}")
 
+    async def terminate(self):
+        """插件销毁时清理"""
+        # 先停掉周期清理任务，避免与下面的清理抢 os.unlink
+        self._stop_event.set()
+        if self._cleanup_task is not None:
+            try:
+                await self._cleanup_task
+            except Exception:
+                pass
+            self._cleanup_task = None
+
+        # 临时文件清理与浏览器关闭互不依赖，并行执行缩短关停时间
+        results = await asyncio.gather(
+            self._cleanup_temp_files(),
+            self._close_browser(),
+            return_exceptions=True,
+        )
+        for r in results:
+            if isinstance(r, Exception):
+                logger.error(f"插件清理时出错: {r}")
+
+        # Playwright 实例必须在浏览器关闭之后停止
         try:
             if self._playwright:
                 await self._playwright.stop()
@@ -1010,20 +1470,6 @@ class CodeRenderPlugin(Star):
         except Exception as e:
             logger.error(f"停止 Playwright 实例时出错: {e}")
 
-    def _generate_hljs_language_registrations(self) -> str:
-        """生成自定义语言的 highlight.js 注册代码"""
-        if not self.custom_languages:
-            return ""
-        
-        registrations = []
-        
-        for lang_id, lang_def in self.custom_languages.items():
-            # 生成 highlight.js 语言定义
-            hljs_def = self._convert_to_hljs_definition(lang_id, lang_def)
-            registrations.append(hljs_def)
-        
-        return "\n".join(registrations)
-    
     def _convert_to_hljs_definition(self, lang_id: str, lang_def: dict) -> str:
         """将自定义语言定义转换为 highlight.js 注册代码"""
         name = lang_def.get("name", lang_id)
@@ -1156,19 +1602,16 @@ class CodeRenderPlugin(Star):
         Returns:
             (code, language_hint)
         """
-        # 匹配 markdown 代码块 \`\`\`language\ncode\`\`\`
-        code_block_pattern = r'\`\`\`(\w*)\n?([\s\S]*?)\`\`\`'
-        match = re.search(code_block_pattern, text)
-        if match:
-            lang_hint = match.group(1) or None
-            code = match.group(2).strip()
-            return code, lang_hint
-        
-        # 匹配单行代码 `code`
-        inline_code_pattern = r'`([^`]+)`'
-        match = re.search(inline_code_pattern, text)
-        if match:
-            return match.group(1), None
+        # 一趟扫描同时匹配 markdown 代码块与单行代码，代码块优先
+        inline_code = None
+        for match in CODE_RE.finditer(text):
+            if match.group('block') is not None:
+                lang_hint = match.group('lang') or None
+                return match.group('block').strip(), lang_hint
+            if inline_code is None:
+                inline_code = match.group('inline')
+        if inline_code is not None:
+            return inline_code, None
         
         # 没有代码块标记，返回原文本
         return text.strip(), None